@@ -16,7 +16,7 @@ import os
 
 from llm_engine import LLMEngine, check_system_ready
 from video_pipeline.script_generator import generate_script
-from video_pipeline.video_generator import generate_video
+from video_pipeline.video_generator import generate_video, start_warmup
 from config import SERVER_CONFIG, VIDEOS_DIR
 
 # Custom logging filter to suppress harmless connection errors
@@ -266,6 +266,9 @@ async def startup_event():
     else:
         print(f"✅ Model '{llm_engine.model}' is ready")
     
+    # Build the video generator and run encoder probes before the first request
+    start_warmup()
+    
     print(f"\n🌐 Server running at http://localhost:{SERVER_CONFIG['port']}")
     print("📚 Ready to answer educational questions!\n")
 
@@ -44,6 +44,46 @@ ANIMATION_CONFIG = {
     "text_color": "#ffffff",
 }
 
+# Manim render settings
+MANIM_CONFIG = {
+    # "cairo" (CPU, works headless) or "opengl" (GPU rasterization, needs a GL context)
+    "renderer": os.environ.get("MANIM_RENDERER", "cairo"),
+    # Every generated scene is unique, so Manim's partial-movie cache never hits
+    # and hashing each animation is pure overhead
+    "disable_caching": True,
+    # Persistent render processes with manim pre-imported. Opt-in: the default
+    # 0 runs the manim CLI per render, isolating every generated script
+    "workers": int(os.environ.get("MANIM_WORKERS", 0)),
+    # Renders before a worker is replaced (a failed render replaces it at once)
+    "worker_max_jobs": int(os.environ.get("MANIM_WORKER_MAX_JOBS", 10)),
+}
+
+# AI scene image settings (Pollinations API)
+IMAGE_CONFIG = {
+    # "flux" (best quality) or "turbo" (faster, lower fidelity)
+    "model": os.environ.get("IMAGE_MODEL", "flux"),
+    # Scenes are requested at the animator's frame size: no pixels are
+    # generated only to be scaled away or letterboxed
+    "width": 1280,
+    "height": 720,
+}
+
+# Image-to-video animator settings
+ANIMATOR_CONFIG = {
+    # "cpu" (ffmpeg filter graph / probed encoder) or "nvenc" (frames encoded
+    # on the GPU through PyNvVideoCodec, falling back to "cpu" when unavailable).
+    # Also picks the encoder for text videos.
+    "backend": os.environ.get("ANIMATOR_BACKEND", "cpu"),
+}
+
+# Output profiles picked by video_id prefix (e.g. "mob_1a2b3c"); other ids use "default".
+# Frame builders are time-based, so a lower fps renders and encodes fewer frames.
+VIDEO_PROFILES = {
+    "default": {"fps": 30},
+    "mob_": {"fps": 24},
+    "web_": {"fps": 30},
+}
+
 # Video quality presets
 QUALITY_PRESETS = {
     "480p": {"width": 854, "height": 480},
@@ -1,14 +1,16 @@
 """
 Video Pipeline - Converts answer text to video
 """
-from .script_generator import generate_script, generate_detailed_script
-from .video_generator import generate_video, generate_video_with_progress
+from .script_generator import generate_script, generate_script_async, generate_detailed_script
+from .video_generator import generate_video, generate_video_async, generate_video_with_progress
 from .progress import ProgressTracker
 
 __all__ = [
     'generate_script',
+    'generate_script_async',
     'generate_detailed_script',
     'generate_video',
+    'generate_video_async',
     'generate_video_with_progress',
     'ProgressTracker'
 ]
@@ -0,0 +1,28 @@
+"""
+Blend kernels - Numba-compiled per-pixel blends for the animator
+numba is optional: crossfade_inplace is None when it is not installed.
+"""
+import numpy as np
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # cache=True keeps the compiled kernel on disk, so only the very first
+    # process on a host pays the JIT compile
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def crossfade_inplace(dst, a, b, alpha):
+        """dst = a * (1 - alpha) + b * alpha for HxWx3 uint8 frames (rounded like cv2.addWeighted)"""
+        height, width, channels = dst.shape
+        inv_alpha = 1.0 - alpha
+        for y in numba.prange(height):
+            for x in range(width):
+                for c in range(channels):
+                    dst[y, x, c] = np.uint8(a[y, x, c] * inv_alpha + b[y, x, c] * alpha + 0.5)
+else:
+    crossfade_inplace = None
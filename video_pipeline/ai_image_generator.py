@@ -2,13 +2,45 @@
 AI Image Generator - Uses Google Gemini/Imagen to generate images from text
 """
 import os
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+
+import requests
 import google.generativeai as genai
-from PIL import Image
-from config import GEMINI_CONFIG
+from PIL import Image, ImageDraw
+from config import GEMINI_CONFIG, IMAGE_CONFIG
 
 # We no longer need local torch/diffusers
 AI_LIBS_AVAILABLE = True  # We use API now
 
+# Scene downloads from all videos share one bounded pool, so concurrent
+# requests overlap their images without spawning threads per video
+IMAGE_WORKERS = 8
+_IMAGE_EXECUTOR = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="ai-image")
+
+# One session for the warm-up ping and all downloads, so they share connections
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=IMAGE_WORKERS))
+
+SCENE_PROMPT_PREFIX = """
+            You are a creative director for a 3D animated educational short.
+            
+            Style Guide: 
+            - 3D Pixar/Disney style animation, vibrant colors, expressive characters.
+            - Cute, friendly atmosphere.
+            - High quality 3D render, raytracing, 4k.
+            
+            Sequence:
+            1. Scene 1: An engaging opening shot introducing the topic (visual metaphor).
+            2. Scene 2: The core action or mechanism explaining HOW it works.
+            3. Scene 3: A fun conclusion or real-world application.
+            
+            Format: Just the visual description per line. No labels.
+"""
+
 class AIImageGenerator:
     """Generates AI images using Google's Generative AI"""
     
@@ -27,7 +59,13 @@ class AIImageGenerator:
         """No-op for API based generator"""
         pass
     
-    def generate_image(self, prompt: str, output_path: str, width: int = 1024, height: int = 1024) -> str:
+    def generate_image(
+        self,
+        prompt: str,
+        output_path: str,
+        width: int = IMAGE_CONFIG["width"],
+        height: int = IMAGE_CONFIG["height"]
+    ) -> str:
         """
         Generate an AI image from text prompt using Pollinations.ai (Free, High Quality)
         """
@@ -35,16 +73,12 @@ class AIImageGenerator:
             print(f"[AI IMAGE] Generating with Pollinations AI: {prompt[:50]}...")
             
             # Use Pollinations.ai (No API key required, reliable free tier)
-            import requests
-            import time
-            from urllib.parse import quote
-            
             # Encode prompt
             encoded_prompt = quote(prompt)
-            url = f"https://pollinations.ai/p/{encoded_prompt}?width={width}&height={height}&seed={int(time.time())}&model=flux"
+            url = f"https://pollinations.ai/p/{encoded_prompt}?width={width}&height={height}&seed={int(time.time())}&model={IMAGE_CONFIG['model']}"
             
             # Download image
-            response = requests.get(url, timeout=30)
+            response = _HTTP_SESSION.get(url, timeout=30)
             if response.status_code == 200:
                 # Save image
                 os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -63,9 +97,6 @@ class AIImageGenerator:
             try:
                 # Fallback: Create a beautiful synthetic image using PIL
                 print("[AI IMAGE] Fallback... Creating synthetic scene...")
-                import random
-                from PIL import ImageDraw, ImageFont
-                
                 # Create abstract art background
                 img = Image.new('RGB', (width, height), color=(10, 10, 25))
                 draw = ImageDraw.Draw(img)
@@ -87,7 +118,8 @@ class AIImageGenerator:
     def generate_scene_images(self, answer_text: str, video_id: str, num_scenes: int = 3) -> list:
         """Generate multiple scene images from answer text"""
         try:
-            # Create prompts
+            # Open the image API connection while Gemini writes the prompts
+            _IMAGE_EXECUTOR.submit(self._warm_up_image_api)
             prompts = self._create_scene_prompts(answer_text, num_scenes)
             return self.generate_images_from_list(prompts, video_id)
             
@@ -95,43 +127,104 @@ class AIImageGenerator:
             print(f"[AI IMAGE] Error generating scene images: {e}")
             return []
 
+    async def generate_scene_images_async(self, answer_text: str, video_id: str, num_scenes: int = 3) -> list:
+        """Async variant: overlaps prompt generation with an image API warm-up ping"""
+        prompts, _ = await asyncio.gather(
+            self._create_scene_prompts_async(answer_text, num_scenes),
+            asyncio.to_thread(self._warm_up_image_api)
+        )
+        return await self.generate_images_from_list_async(prompts, video_id)
+
+    def generate_one_image(self, prompt: str, video_id: str, index: int) -> str:
+        """Generate the image for one scene of a video"""
+        return self.generate_image(prompt, f"videos/frames/{video_id}_scene_{index}.png")
+
     def generate_images_from_list(self, prompts: list, video_id: str) -> list:
-        """Generate images from a list of prompts"""
-        image_paths = []
-        for i, prompt in enumerate(prompts):
-            output_path = f"videos/frames/{video_id}_scene_{i}.png"
-            path = self.generate_image(prompt, output_path)
-            if path:
-                image_paths.append(path)
-        return image_paths
+        """Generate images from a list of prompts concurrently, keeping prompt order"""
+        paths = _IMAGE_EXECUTOR.map(
+            self.generate_one_image, prompts, [video_id] * len(prompts), range(len(prompts))
+        )
+        return [path for path in paths if path]
+
+    def iter_scene_images(self, answer_text: str, video_id: str, num_scenes: int = 3):
+        """Yield (scene_index, image_path) pairs as each scene image finishes"""
+        prompts = self._create_scene_prompts(answer_text, num_scenes)
+        yield from self.iter_images_from_list(prompts, video_id)
+
+    def iter_images_from_list(self, prompts: list, video_id: str):
+        """
+        Generate images concurrently and yield (index, path) in completion order.
+        path is None when an image could not be generated.
+        """
+        futures = {
+            _IMAGE_EXECUTOR.submit(self.generate_one_image, prompt, video_id, i): i
+            for i, prompt in enumerate(prompts)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    async def generate_images_from_list_async(self, prompts: list, video_id: str) -> list:
+        """Generate images from a list of prompts concurrently, keeping prompt order"""
+        loop = asyncio.get_running_loop()
+        paths = await asyncio.gather(*(
+            loop.run_in_executor(_IMAGE_EXECUTOR, self.generate_one_image, prompt, video_id, i)
+            for i, prompt in enumerate(prompts)
+        ))
+        return [path for path in paths if path]
+
+    async def generate_image_async(
+        self,
+        prompt: str,
+        output_path: str,
+        width: int = IMAGE_CONFIG["width"],
+        height: int = IMAGE_CONFIG["height"]
+    ) -> str:
+        """Async variant of generate_image (runs the download off the event loop)"""
+        return await asyncio.to_thread(self.generate_image, prompt, output_path, width, height)
+
+    def _warm_up_image_api(self):
+        """
+        Open a connection to the image API while prompts are being written;
+        it stays in the shared session's pool for the image downloads
+        """
+        try:
+            _HTTP_SESSION.head("https://pollinations.ai", timeout=5)
+        except Exception:
+            pass
+    
+    def _build_scene_prompt(self, answer_text: str, num_scenes: int) -> str:
+        """Build the storytelling prompt sent to the Gemini text model"""
+        # Static instructions come first so the prompt prefix is byte-identical
+        # across calls (lets server-side prefix caching hit); dynamic text goes last.
+        return f"""{SCENE_PROMPT_PREFIX}
+            Create {num_scenes} sequential image prompts to visualize this concept:
+            Concept: "{answer_text[:500]}..."
+            """
+
+    def _parse_scene_prompts(self, response_text: str, num_scenes: int) -> list:
+        lines = [l.strip() for l in response_text.strip().split('\n') if l.strip()]
+        return lines[:num_scenes]
+
+    def _fallback_scene_prompts(self, answer_text: str, num_scenes: int) -> list:
+        base = "3d pixar style educational animation, cute, vibrant, 4k render of: "
+        return [f"{base} {answer_text[:50]} scene {i+1}" for i in range(num_scenes)]
     
     def _create_scene_prompts(self, answer_text: str, num_scenes: int) -> list:
         """Create descriptive prompts using Gemini Text model"""
         try:
             model = genai.GenerativeModel("gemini-1.5-flash") # Use flash for prompt Gen
-            
-            # Updated Prompt for Storytelling style
-            prompt = f"""
-            You are a creative director for a 3D animated educational short.
-            Create {num_scenes} sequential image prompts to visualize this concept:
-            Concept: "{answer_text[:500]}..."
-            
-            Style Guide: 
-            - 3D Pixar/Disney style animation, vibrant colors, expressive characters.
-            - Cute, friendly atmosphere.
-            - High quality 3D render, raytracing, 4k.
-            
-            Sequence:
-            1. Scene 1: An engaging opening shot introducing the topic (visual metaphor).
-            2. Scene 2: The core action or mechanism explaining HOW it works.
-            3. Scene 3: A fun conclusion or real-world application.
-            
-            Format: Just the visual description per line. No labels.
-            """
-            response = model.generate_content(prompt)
-            lines = [l.strip() for l in response.text.strip().split('\n') if l.strip()]
-            return lines[:num_scenes]
+            response = model.generate_content(self._build_scene_prompt(answer_text, num_scenes))
+            return self._parse_scene_prompts(response.text, num_scenes)
+        except:
+             # Fallback
+             return self._fallback_scene_prompts(answer_text, num_scenes)
+
+    async def _create_scene_prompts_async(self, answer_text: str, num_scenes: int) -> list:
+        """Async variant of _create_scene_prompts"""
+        try:
+            model = genai.GenerativeModel("gemini-1.5-flash") # Use flash for prompt Gen
+            response = await model.generate_content_async(self._build_scene_prompt(answer_text, num_scenes))
+            return self._parse_scene_prompts(response.text, num_scenes)
         except:
              # Fallback
-             base = "3d pixar style educational animation, cute, vibrant, 4k render of: "
-             return [f"{base} {answer_text[:50]} scene {i+1}" for i in range(num_scenes)]
+             return self._fallback_scene_prompts(answer_text, num_scenes)
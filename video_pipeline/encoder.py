@@ -0,0 +1,431 @@
+"""
+Encoder - Opens the fastest available video writer for the pipeline
+"""
+import atexit
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Optional: direct NVENC access without an ffmpeg encode process
+try:
+    import PyNvVideoCodec as nvc
+    PYNVC_AVAILABLE = True
+except ImportError:
+    nvc = None
+    PYNVC_AVAILABLE = False
+
+# ffmpeg H.264 encoders in order of preference, with their output options
+FFMPEG_ENCODERS = [
+    ("h264_nvenc", ["-preset", "p1", "-pix_fmt", "yuv420p"]),
+    ("h264_qsv", ["-preset", "veryfast", "-pix_fmt", "nv12"]),
+    ("h264_vaapi", ["-vaapi_device", "/dev/dri/renderD128", "-vf", "format=nv12,hwupload"]),
+    ("libx264", ["-preset", "ultrafast", "-pix_fmt", "yuv420p"]),
+]
+
+# PyNvVideoCodec encoder settings
+PYNVC_OPTIONS = {"codec": "h264", "preset": "P4", "tuning_info": "high_quality", "bitrate": "8M"}
+
+# OpenCV writer fallback: let its FFmpeg backend pick any hardware encoder
+HW_WRITER_PARAMS = [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+NVENC_WRITER_OPTIONS = "video_codec;h264_nvenc|preset;p1"
+
+# OpenCV FourCCs in order of preference (browser-friendly H.264 first)
+CV2_FOURCC_CANDIDATES = ['avc1', 'H264', 'mp4v', 'MJPG']
+
+
+class FFmpegPipeWriter:
+    """
+    cv2.VideoWriter-compatible writer that pipes raw BGR frames into ffmpeg.
+
+    ffmpeg encodes into output_path; if final_path is set when the writer is
+    released, the finished file is renamed there (used by FFmpegEncoderPool,
+    whose processes are started before the real output path is known).
+    """
+
+    def __init__(
+        self,
+        ffmpeg_path: str,
+        output_path: str,
+        fps: int,
+        size: Tuple[int, int],
+        codec: str,
+        codec_args: List[str]
+    ):
+        width, height = size
+        cmd = [
+            ffmpeg_path, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-c:v", codec, *codec_args,
+            output_path
+        ]
+        self.output_path = output_path
+        self.final_path = None
+        # Buffered stdin: BufferedWriter.write always writes the whole frame,
+        # where a raw pipe write may stop short and shift every later frame
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def isOpened(self) -> bool:
+        return self.proc.poll() is None
+
+    def write(self, frame: np.ndarray):
+        # Contiguous frames are written straight from their buffer, without a copy
+        self.proc.stdin.write(memoryview(frame) if frame.flags.c_contiguous else frame.tobytes())
+
+    def release(self):
+        """Finish the encode; raises (and removes the partial file) if ffmpeg failed"""
+        self._close_stdin()
+        self.proc.wait()
+        if self.proc.returncode != 0:
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+            raise RuntimeError(f"ffmpeg exited with code {self.proc.returncode}")
+        if self.final_path:
+            os.replace(self.output_path, self.final_path)
+
+    def discard(self):
+        """Stop ffmpeg without producing a video"""
+        self.proc.kill()
+        self.proc.wait()
+        self._close_stdin()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def _close_stdin(self):
+        """Flush and close stdin; a dead ffmpeg is reported through its exit code"""
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+class NvencWriter:
+    """
+    cv2.VideoWriter-compatible writer that encodes on the GPU through
+    PyNvVideoCodec. The raw H.264 stream is remuxed into MP4 with ffmpeg
+    (stream copy, no re-encode) on release.
+    """
+
+    def __init__(self, ffmpeg_path: str, output_path: str, fps: int, size: Tuple[int, int]):
+        self.width, self.height = size
+        self.fps = fps
+        self.ffmpeg_path = ffmpeg_path
+        self.output_path = output_path
+        self.stream_path = output_path + ".h264"
+        options = dict(PYNVC_OPTIONS, fps=str(fps))
+        try:
+            # Packed BGRA input: NVENC converts to YUV on the GPU during the upload,
+            # so the host does a single pass (BGR -> BGRA) per frame
+            self.encoder = nvc.CreateEncoder(self.width, self.height, "ARGB", True, **options)
+            self._input = np.empty((self.height, self.width, 4), dtype=np.uint8)
+            self._convert = self._to_bgra
+        except Exception:
+            self.encoder = nvc.CreateEncoder(self.width, self.height, "NV12", True, **options)
+            self._input = np.empty((self.height * 3 // 2, self.width), dtype=np.uint8)
+            self._convert = self._to_nv12
+        self.stream = open(self.stream_path, "wb")
+
+    def isOpened(self) -> bool:
+        return not self.stream.closed
+
+    def write(self, frame: np.ndarray):
+        self.stream.write(bytearray(self.encoder.Encode(self._convert(frame))))
+
+    def release(self):
+        self.stream.write(bytearray(self.encoder.EndEncode()))
+        self.stream.close()
+        result = subprocess.run(
+            [
+                self.ffmpeg_path, "-y", "-loglevel", "error",
+                "-f", "h264", "-r", str(self.fps), "-i", self.stream_path,
+                "-c", "copy", self.output_path
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        if result.returncode != 0:
+            # Keep the encoded stream so the frames are not lost
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+            raise RuntimeError(
+                f"ffmpeg remux exited with code {result.returncode}, "
+                f"stream kept at {self.stream_path}: {result.stderr.decode(errors='replace').strip()}"
+            )
+        os.remove(self.stream_path)
+
+    def discard(self):
+        """Stop encoding without producing a video"""
+        self.stream.close()
+        for path in (self.stream_path, self.output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _to_bgra(self, frame: np.ndarray) -> np.ndarray:
+        """BGR -> BGRA (NVENC's ARGB word order) into a reused buffer"""
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=self._input)
+
+    def _to_nv12(self, frame: np.ndarray) -> np.ndarray:
+        """BGR -> NV12 (Y plane followed by interleaved UV) into a reused buffer"""
+        h = self.height
+        i420 = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        self._input[:h] = i420[:h]
+        u_plane, v_plane = i420[h:].reshape(2, h // 2, self.width // 2)
+        uv = self._input[h:].reshape(h // 2, self.width // 2, 2)
+        uv[..., 0] = u_plane
+        uv[..., 1] = v_plane
+        return self._input
+
+
+class FFmpegEncoderPool:
+    """
+    Keeps one pre-started ffmpeg process on standby per (output dir, fps, size),
+    so a request does not pay process start-up and library loading before its
+    first frame. Standby processes encode into a hidden temporary file in the
+    output directory, which is renamed to the requested path on release.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._standby = {}
+        self._swept_dirs = set()
+        self._started_at = time.time()
+        atexit.register(self.shutdown)
+
+    def acquire(self, output_path: str, fps: int, size: Tuple[int, int], encoder) -> FFmpegPipeWriter:
+        key = (os.path.dirname(os.path.abspath(output_path)), fps, tuple(size))
+        with self._lock:
+            if key[0] not in self._swept_dirs:
+                self._sweep(key[0])
+                self._swept_dirs.add(key[0])
+            writer = self._standby.pop(key, None)
+            # Start the next request's process now, while this one encodes
+            self._standby[key] = self._spawn(key, encoder)
+        
+        if writer is None or not writer.isOpened():
+            if writer is not None:
+                writer.discard()
+            writer = self._spawn(key, encoder)
+        writer.final_path = output_path
+        return writer
+
+    def shutdown(self):
+        with self._lock:
+            standby, self._standby = self._standby, {}
+        for writer in standby.values():
+            writer.discard()
+
+    def _sweep(self, output_dir: str):
+        """Remove temporary files left by processes killed before they could clean up"""
+        try:
+            entries = list(os.scandir(output_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not (entry.name.startswith(".encoding_") and entry.name.endswith(".mp4")):
+                continue
+            try:
+                # Newer files may belong to another live process sharing the directory
+                if entry.stat().st_mtime < self._started_at:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _spawn(self, key, encoder) -> FFmpegPipeWriter:
+        output_dir, fps, size = key
+        ffmpeg_path, codec, codec_args = encoder
+        temp_path = os.path.join(output_dir, f".encoding_{uuid.uuid4().hex}.mp4")
+        return FFmpegPipeWriter(ffmpeg_path, temp_path, fps, size, codec, list(codec_args))
+
+
+_ENCODER_POOL = FFmpegEncoderPool()
+
+
+def _ffmpeg_encoder_works(ffmpeg_path: str, codec: str, codec_args: List[str]) -> bool:
+    """Encode a few blank frames to check the encoder (and its hardware) is usable"""
+    cmd = [
+        ffmpeg_path, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+        "-c:v", codec, *codec_args,
+        "-f", "null", "-"
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15)
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+_ENCODER_PROBE_LOCK = threading.Lock()
+
+
+def select_ffmpeg_encoder() -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    """
+    Find the best working ffmpeg H.264 encoder on this host.
+
+    Returns (ffmpeg_path, codec, codec_args), or None when ffmpeg is missing.
+    The probe runs once per process; concurrent first callers wait for it.
+    """
+    with _ENCODER_PROBE_LOCK:
+        return _probe_ffmpeg_encoder()
+
+
+@functools.lru_cache(maxsize=1)
+def _probe_ffmpeg_encoder() -> Optional[Tuple[str, str, Tuple[str, ...]]]:
+    ffmpeg_path = shutil.which("ffmpeg")
+    if not ffmpeg_path:
+        return None
+
+    for codec, codec_args in FFMPEG_ENCODERS:
+        if _ffmpeg_encoder_works(ffmpeg_path, codec, codec_args):
+            print(f"[ENCODER] Using ffmpeg encoder: {codec}")
+            return ffmpeg_path, codec, tuple(codec_args)
+    return None
+
+
+def discard_video_writer(out, output_path: str):
+    """Stop a writer after a failed render and remove its partial output"""
+    discard = getattr(out, "discard", None)
+    if discard is not None:
+        discard()
+    else:
+        out.release()
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+
+def link_or_copy(src, dst):
+    """
+    Hard-link src to dst (no data copy), copying when linking is not possible
+    (cross-device; shutil.copyfile uses sendfile on Linux). The link or copy
+    is made under a temporary name and renamed over dst, so a reader never
+    sees dst missing or half-written.
+    """
+    temp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(src, temp_path)
+        except OSError:
+            shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Set once PyNvVideoCodec fails to create an encoder (no GPU or driver), so
+# later writers go straight to ffmpeg instead of retrying CUDA initialization
+_nvenc_unavailable = False
+
+
+def open_nvenc_writer(output_path: str, fps: int, size: Tuple[int, int]) -> Optional[NvencWriter]:
+    """PyNvVideoCodec writer, or None when the library, a GPU or ffmpeg is missing"""
+    global _nvenc_unavailable
+    if not PYNVC_AVAILABLE or _nvenc_unavailable:
+        return None
+    ffmpeg_path = shutil.which("ffmpeg")
+    if not ffmpeg_path:
+        return None
+    try:
+        return NvencWriter(ffmpeg_path, output_path, fps, size)
+    except OSError as e:
+        # The encoder works; only this writer's stream file could not be opened
+        print(f"[ENCODER] Could not open NVENC stream: {e}")
+        return None
+    except Exception as e:
+        _nvenc_unavailable = True
+        print(f"[ENCODER] PyNvVideoCodec unavailable, using ffmpeg for this process: {e}")
+        return None
+
+
+def open_video_writer(output_path: str, fps: int, size: Tuple[int, int], use_nvenc: bool = False):
+    """
+    Open a video writer, preferring hardware H.264 encoding.
+
+    Order: PyNvVideoCodec (GPU NVENC, only with use_nvenc), then an
+    ffmpeg subprocess with the best probed encoder (NVENC, QSV,
+    VAAPI, then libx264 ultrafast), then OpenCV's FFmpeg backend with
+    hardware acceleration requested, then a plain OpenCV writer. OpenCV
+    writers use the best probed FourCC.
+    """
+    if use_nvenc:
+        out = open_nvenc_writer(output_path, fps, size)
+        if out is not None:
+            return out
+
+    encoder = select_ffmpeg_encoder()
+    if encoder:
+        return _ENCODER_POOL.acquire(output_path, fps, size, encoder)
+
+    return _open_cv2_writer(output_path, fps, size)
+
+
+_FOURCC_PROBE_LOCK = threading.Lock()
+
+
+def best_fourcc() -> int:
+    """
+    First FourCC the local OpenCV build can actually open a writer with.
+
+    cv2.VideoWriter_fourcc never fails for an unsupported codec; the writer
+    just comes back closed and produces an empty file, so each candidate is
+    probed once with a tiny writer and the result cached for the process.
+    """
+    with _FOURCC_PROBE_LOCK:
+        return _probe_fourcc()
+
+
+@functools.lru_cache(maxsize=1)
+def _probe_fourcc() -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        probe_path = os.path.join(tmp_dir, "probe.mp4")
+        for code in CV2_FOURCC_CANDIDATES:
+            fourcc = cv2.VideoWriter_fourcc(*code)
+            out = cv2.VideoWriter(probe_path, fourcc, 30, (64, 64))
+            opened = out.isOpened()
+            out.release()
+            if opened:
+                print(f"[ENCODER] OpenCV writer FourCC: {code}")
+                return fourcc
+    return cv2.VideoWriter_fourcc(*'mp4v')
+
+
+_CV2_WRITER_ENV_LOCK = threading.Lock()
+
+
+def _open_cv2_writer(output_path: str, fps: int, size: Tuple[int, int]):
+    """Open an OpenCV writer, asking its bundled FFmpeg for hardware encoding"""
+    fourcc = best_fourcc()
+
+    # OpenCV reads the writer options from the environment when opening,
+    # so only set them for this call unless the user configured their own.
+    # The lock keeps concurrent opens from seeing each other's options.
+    out = None
+    with _CV2_WRITER_ENV_LOCK:
+        if "OPENCV_FFMPEG_WRITER_OPTIONS" not in os.environ:
+            os.environ["OPENCV_FFMPEG_WRITER_OPTIONS"] = NVENC_WRITER_OPTIONS
+            try:
+                out = cv2.VideoWriter(output_path, cv2.CAP_FFMPEG, fourcc, fps, size, HW_WRITER_PARAMS)
+            finally:
+                del os.environ["OPENCV_FFMPEG_WRITER_OPTIONS"]
+    if out is not None:
+        if out.isOpened():
+            return out
+        out.release()
+
+    out = cv2.VideoWriter(output_path, cv2.CAP_FFMPEG, fourcc, fps, size, HW_WRITER_PARAMS)
+    if out.isOpened():
+        return out
+    out.release()
+
+    return cv2.VideoWriter(output_path, fourcc, fps, size)
@@ -1,11 +1,43 @@
 """
 Image to Video Animator - Creates videos from AI-generated images
 """
+import functools
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from config import ANIMATOR_CONFIG
+from ._blend_numba import crossfade_inplace
+from .encoder import discard_video_writer, open_nvenc_writer, open_video_writer, select_ffmpeg_encoder
+
+# Sentinel closing the reader/writer pipeline queues
+_DONE = object()
+
+
+@functools.lru_cache(maxsize=256)
+def _text_size(text: str, font_scale: float, thickness: int) -> Tuple[int, int]:
+    """Cached (width, height) of text rendered with FONT_HERSHEY_SIMPLEX"""
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)[0]
+
+
+def _resize_interpolation(src_size: Tuple[int, int], dst_size: Tuple[int, int]) -> int:
+    """
+    INTER_AREA for downscales (box averaging: faster than bilinear here and
+    free of the aliasing that costs h264 bitrate), INTER_CUBIC for upscales
+    """
+    if dst_size[0] * dst_size[1] < src_size[0] * src_size[1]:
+        return cv2.INTER_AREA
+    return cv2.INTER_CUBIC
 
 
 class ImageToVideoAnimator:
@@ -15,14 +47,23 @@ class ImageToVideoAnimator:
         self.width = 1280
         self.height = 720
         self.fps = 30
+        self.zoom_factor = 1.15  # Ken Burns zoom in by 15%
+        self.backend = ANIMATOR_CONFIG["backend"]
+        self._overlay_cache = {}
+        self._blend_buf = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        # Canvases reused by streamed decoding: one being loaded, two queued by
+        # _prefetch and one being animated are in flight at most
+        self._canvas_pool = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(4)]
         
-    def _apply_ken_burns_effect(self, img: np.ndarray, frames: int) -> List[np.ndarray]:
-        """Apply Ken Burns (Zoom/Pan) effect to an image"""
+    def _apply_ken_burns_effect(self, img: np.ndarray, frames: int) -> Iterator[np.ndarray]:
+        """
+        Apply Ken Burns (Zoom/Pan) effect to an image.
+        Frames are yielded one at a time so the encoder can start on a scene
+        before the rest of its motion is rendered.
+        """
         h, w = img.shape[:2]
-        motion_frames = []
         
-        # Randomly choose zoom direction (in or out)
-        zoom_factor = 1.15  # Zoom in/out by 15%
+        zoom_factor = self.zoom_factor
         
         # Center crop (full view)
         center_x, center_y = w // 2, h // 2
@@ -33,10 +74,7 @@ class ImageToVideoAnimator:
             
             # Create rotation matrix for scaling from center
             M = cv2.getRotationMatrix2D((center_x, center_y), 0, scale)
-            result = cv2.warpAffine(img, M, (w, h))
-            motion_frames.append(result)
-            
-        return motion_frames
+            yield cv2.warpAffine(img, M, (w, h))
 
     def create_video_from_images(
         self,
@@ -49,67 +87,327 @@ class ImageToVideoAnimator:
         try:
             print(f"[VIDEO ANIMATOR] Creating animated story from {len(image_paths)} scenes...")
             
-            # Create video writer
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*'avc1')
-            except:
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                
-            out = cv2.VideoWriter(output_path, fourcc, self.fps, (self.width, self.height))
+            # Decode and resize all images up front (cv2 releases the GIL while decoding)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                images = list(executor.map(self._load_and_resize_image, image_paths))
             
-            for i, img_path in enumerate(image_paths):
-                # Load resizing
-                img = self._load_and_resize_image(img_path)
-                
-                # Generate motion frames
-                static_frames_count = int((duration_per_image - transition_duration) * self.fps)
-                motion_sequence = self._apply_ken_burns_effect(img, static_frames_count)
-                
-                for frame in motion_sequence:
-                    out.write(frame)
+            out = self._open_nvenc_writer(output_path)
+            if out is None:
+                # Let ffmpeg synthesize motion and transitions when it is available
+                encoder = select_ffmpeg_encoder()
+                if images and encoder and encoder[1] != "h264_vaapi":
+                    if self._render_with_ffmpeg_filters(images, output_path, duration_per_image, transition_duration, encoder):
+                        print(f"[VIDEO ANIMATOR] Animated story created: {output_path}")
+                        return output_path
+                    print("[VIDEO ANIMATOR] ffmpeg filter render failed, writing frames directly")
                 
-                # Transition (Cross-fade)
-                if i < len(image_paths) - 1:
-                    next_img = self._load_and_resize_image(image_paths[i + 1])
-                    next_start = self._apply_ken_burns_effect(next_img, 1)[0] # Start state of next
-                    
-                    last_frame = motion_sequence[-1]
-                    trans_frames = int(transition_duration * self.fps)
-                    
-                    for f in range(trans_frames):
-                        alpha = f / trans_frames
-                        blended = cv2.addWeighted(last_frame, 1 - alpha, next_start, alpha, 0)
-                        out.write(blended)
-                        
+                # Create video writer (hardware H.264 when available)
+                out = open_video_writer(output_path, self.fps, (self.width, self.height))
+            
+            try:
+                self._write_story(out, images, duration_per_image, transition_duration)
+            except Exception:
+                discard_video_writer(out, output_path)
+                raise
+            
+            out.release()
+            print(f"[VIDEO ANIMATOR] Animated story created: {output_path}")
+            return output_path
+        except Exception as e:
+            print(f"Error: {e}")
+            traceback.print_exc()
+            return None
+
+    def _open_nvenc_writer(self, output_path: str):
+        """GPU writer when the "nvenc" backend is configured, else None (CPU backend)"""
+        if self.backend != "nvenc":
+            return None
+        out = open_nvenc_writer(output_path, self.fps, (self.width, self.height))
+        if out is None:
+            print("[VIDEO ANIMATOR] NVENC backend unavailable, using the CPU backend")
+        return out
+
+    def _render_with_ffmpeg_filters(
+        self,
+        images: List[np.ndarray],
+        output_path: str,
+        duration_per_image: int,
+        transition_duration: float,
+        encoder: Tuple[str, str, Tuple[str, ...]]
+    ) -> bool:
+        """
+        Render the story in a single ffmpeg call: each image is written once as a
+        PNG, zoompan produces the Ken Burns motion and xfade the cross-fades, so
+        no per-frame pixels pass through Python or the encoder pipe.
+        Clip lengths, zoom schedule and fades match _write_story frame for frame:
+        each fade blends the previous clip's held last frame into the next
+        clip's first frame, so the video is n*motion + (n-1)*fade frames long.
+        """
+        ffmpeg_path, codec, codec_args = encoder
+        static_frames_count = int((duration_per_image - transition_duration) * self.fps)
+        trans_frames = int(transition_duration * self.fps)
+        fade = trans_frames > 0 and len(images) > 1
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cmd = [ffmpeg_path, "-y", "-loglevel", "error"]
+            filters = []
+            for i, img in enumerate(images):
+                png_path = os.path.join(tmp_dir, f"scene_{i}.png")
+                cv2.imwrite(png_path, img)
+                cmd += ["-i", png_path]
+                clip = (
+                    f"[{i}:v]zoompan=z='1+{self.zoom_factor - 1.0:.4f}*on/{static_frames_count}'"
+                    f":x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+                    f":d={static_frames_count}:s={self.width}x{self.height}:fps={self.fps}"
+                )
+                if fade:
+                    # Hold the first/last frame for the fade, as _write_story does
+                    start = trans_frames if i > 0 else 0
+                    stop = trans_frames if i < len(images) - 1 else 0
+                    clip += f",tpad=start={start}:start_mode=clone:stop={stop}:stop_mode=clone"
+                filters.append(f"{clip}[v{i}]")
+            
+            last = "v0"
+            if fade:
+                length = static_frames_count + trans_frames
+                for i in range(1, len(images)):
+                    offset = (length - trans_frames) / self.fps
+                    filters.append(
+                        f"[{last}][v{i}]xfade=transition=fade:duration={trans_frames / self.fps}"
+                        f":offset={offset}[x{i}]"
+                    )
+                    last = f"x{i}"
+                    clip_length = static_frames_count + trans_frames * (2 if i < len(images) - 1 else 1)
+                    length += clip_length - trans_frames
+            elif len(images) > 1:
+                inputs = "".join(f"[v{i}]" for i in range(len(images)))
+                filters.append(f"{inputs}concat=n={len(images)}:v=1:a=0[cat]")
+                last = "cat"
+            
+            cmd += [
+                "-filter_complex", ";".join(filters),
+                "-map", f"[{last}]",
+                "-c:v", codec, *codec_args,
+                output_path
+            ]
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        
+        if result.returncode != 0:
+            print(f"[VIDEO ANIMATOR] ffmpeg error: {result.stderr[-500:]}")
+            return False
+        return True
+
+    def create_video_from_image_stream(
+        self,
+        scene_stream: Iterable[Tuple[int, Optional[str]]],
+        output_path: str,
+        duration_per_image: int = 4,
+        transition_duration: float = 0.5
+    ) -> str:
+        """
+        Create video with Ken Burns effect from (scene_index, image_path) pairs
+        that may arrive out of order (e.g. AIImageGenerator.iter_scene_images).
+        Each scene is encoded as soon as it and all earlier scenes are available,
+        so encoding overlaps with the remaining image downloads.
+        """
+        try:
+            print("[VIDEO ANIMATOR] Creating animated story from streamed scenes...")
+            
+            out = self._open_nvenc_writer(output_path)
+            if out is None:
+                out = open_video_writer(output_path, self.fps, (self.width, self.height))
+            try:
+                images = self._prefetch(self._ordered_images(scene_stream))
+                self._write_story(out, images, duration_per_image, transition_duration)
+            except Exception:
+                discard_video_writer(out, output_path)
+                raise
+            
             out.release()
             print(f"[VIDEO ANIMATOR] Animated story created: {output_path}")
             return output_path
         except Exception as e:
             print(f"Error: {e}")
-            import traceback
             traceback.print_exc()
             return None
+
+    def _ordered_images(self, scene_stream: Iterable[Tuple[int, Optional[str]]]) -> Iterator[np.ndarray]:
+        """
+        Re-order streamed scenes by index, skipping scenes whose image failed.
+        Images are decoded into the animator's canvas pool round-robin.
+        """
+        pending = {}
+        next_index = 0
+        loaded = 0
+        
+        def load(path):
+            nonlocal loaded
+            canvas = self._canvas_pool[loaded % len(self._canvas_pool)]
+            loaded += 1
+            return self._load_and_resize_image(path, canvas)
+        
+        for index, path in scene_stream:
+            pending[index] = path
+            while next_index in pending:
+                path = pending.pop(next_index)
+                next_index += 1
+                if path:
+                    yield load(path)
+        
+        # Stream ended with gaps in the indices: emit whatever is left in order
+        for index in sorted(pending):
+            if pending[index]:
+                yield load(pending[index])
+
+    def _prefetch(self, images: Iterable[np.ndarray], depth: int = 2) -> Iterator[np.ndarray]:
+        """
+        Pull images on a reader thread so loading/resizing overlaps frame generation.
+        Closing the returned generator stops the reader and closes the source.
+        """
+        read_q = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            # Give up once the consumer has stopped instead of blocking on a full queue
+            while not stop.is_set():
+                try:
+                    read_q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def reader():
+            try:
+                for img in images:
+                    if not put((img, None)):
+                        break
+            except Exception as e:
+                put((None, e))
+            finally:
+                close = getattr(images, "close", None)
+                if close is not None:
+                    close()
+                put(_DONE)
+        
+        threading.Thread(target=reader, daemon=True).start()
+        try:
+            while True:
+                item = read_q.get()
+                if item is _DONE:
+                    return
+                img, error = item
+                if error is not None:
+                    raise error
+                yield img
+        finally:
+            stop.set()
+
+    def _write_story(
+        self,
+        out,
+        images: Iterable[np.ndarray],
+        duration_per_image: int,
+        transition_duration: float
+    ):
+        """
+        Write Ken Burns clips for each image, cross-fading between consecutive ones.
+        Frames are handed to a writer thread so encoding overlaps frame generation.
+        """
+        static_frames_count = int((duration_per_image - transition_duration) * self.fps)
+        trans_frames = int(transition_duration * self.fps)
+        write_q = queue.Queue(maxsize=30)
+        errors = []
+        
+        def writer():
+            item = write_q.get()
+            while item is not _DONE:
+                # After a failure keep draining so the producer never blocks
+                if not errors:
+                    try:
+                        if isinstance(item, tuple):
+                            # Cross-fade step: blend into one preallocated buffer (no per-frame allocation)
+                            last_frame, next_start, alpha = item
+                            self._crossfade(last_frame, next_start, alpha)
+                            out.write(self._blend_buf)
+                        else:
+                            out.write(item)
+                    except Exception as e:
+                        errors.append(e)
+                item = write_q.get()
+        
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+        try:
+            last_frame = None
+            for img in images:
+                if errors:
+                    break
+                
+                # Stream motion frames to the writer as they are rendered
+                frame = None
+                for i, frame in enumerate(self._apply_ken_burns_effect(img, static_frames_count)):
+                    # Transition (Cross-fade) from the previous scene into this one's start state
+                    if i == 0 and last_frame is not None:
+                        for alpha in np.linspace(0, 1, trans_frames, endpoint=False, dtype=np.float32):
+                            write_q.put((last_frame, frame, alpha))
+                    write_q.put(frame)
+                
+                last_frame = frame
+        finally:
+            write_q.put(_DONE)
+            writer_thread.join()
+            # Stop a prefetching source when the story ends early
+            close = getattr(images, "close", None)
+            if close is not None:
+                close()
+        
+        if errors:
+            raise errors[0]
     
-    def _load_and_resize_image(self, image_path: str) -> np.ndarray:
-        """Load image and resize to video dimensions"""
+    def _crossfade(self, last_frame: np.ndarray, next_start: np.ndarray, alpha: float):
+        """Blend two frames into the blend buffer (Numba kernel when available)"""
+        if crossfade_inplace is not None and last_frame.flags.c_contiguous and next_start.flags.c_contiguous:
+            crossfade_inplace(self._blend_buf, last_frame, next_start, alpha)
+        else:
+            cv2.addWeighted(last_frame, 1 - alpha, next_start, alpha, 0, dst=self._blend_buf)
+
+    def _load_and_resize_image(self, image_path: str, canvas: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Load image and resize to video dimensions.
+        When a frame-sized canvas is given the result is rendered into it
+        instead of allocating a new frame.
+        """
+        if canvas is None:
+            canvas = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        
         # Load image
         img = cv2.imread(image_path)
         
         if img is None:
             # Create a placeholder if image failed to load
-            img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+            canvas.fill(0)
             cv2.putText(
-                img, "Image not found", 
+                canvas, "Image not found", 
                 (self.width // 2 - 100, self.height // 2),
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2
             )
-            return img
+            return canvas
         
         # Resize to fit video dimensions while maintaining aspect ratio
         h, w = img.shape[:2]
         aspect = w / h
         target_aspect = self.width / self.height
         
+        if abs(aspect - target_aspect) < 1e-3:
+            # Same aspect ratio: no letterbox needed, resize straight to frame size
+            if (w, h) == (self.width, self.height):
+                np.copyto(canvas, img)
+            else:
+                interpolation = _resize_interpolation((w, h), (self.width, self.height))
+                cv2.resize(img, (self.width, self.height), dst=canvas, interpolation=interpolation)
+            return canvas
+        
         if aspect > target_aspect:
             # Image is wider
             new_w = self.width
@@ -119,13 +417,27 @@ class ImageToVideoAnimator:
             new_h = self.height
             new_w = int(self.height * aspect)
         
-        resized = cv2.resize(img, (new_w, new_h))
+        interpolation = _resize_interpolation((w, h), (new_w, new_h))
         
-        # Create canvas and center image
-        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        # Center image on the canvas, resizing directly into it where possible.
+        # Only the letterbox bands are zeroed; the interior is overwritten anyway.
         y_offset = (self.height - new_h) // 2
         x_offset = (self.width - new_w) // 2
-        canvas[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = resized
+        y_end = y_offset + new_h
+        x_end = x_offset + new_w
+        if y_offset:
+            canvas[:y_offset] = 0
+        if y_end < self.height:
+            canvas[y_end:] = 0
+        if x_offset:
+            canvas[y_offset:y_end, :x_offset] = 0
+        if x_end < self.width:
+            canvas[y_offset:y_end, x_end:] = 0
+        target = canvas[y_offset:y_end, x_offset:x_end]
+        if target.flags['C_CONTIGUOUS']:
+            cv2.resize(img, (new_w, new_h), dst=target, interpolation=interpolation)
+        else:
+            target[:] = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
         
         return canvas
     
@@ -136,30 +448,49 @@ class ImageToVideoAnimator:
         position: tuple = None,
         font_scale: float = 1.0
     ) -> np.ndarray:
-        """Add text overlay to a frame"""
+        """Add text overlay to a frame (draws in place and returns the frame)"""
         if position is None:
             position = (50, self.height - 50)
         
-        # Add semi-transparent background
-        overlay = frame.copy()
-        cv2.rectangle(
-            overlay,
-            (position[0] - 10, position[1] - 40),
-            (position[0] + len(text) * 20, position[1] + 10),
-            (0, 0, 0),
-            -1
-        )
-        frame = cv2.addWeighted(frame, 0.7, overlay, 0.3, 0)
-        
-        # Add text
-        cv2.putText(
-            frame,
-            text,
-            position,
-            cv2.FONT_HERSHEY_SIMPLEX,
-            font_scale,
-            (255, 255, 255),
-            2
-        )
+        x0, y0, inv_alpha, premultiplied = self._text_overlay_layer(text, tuple(position), font_scale)
+        
+        # Blend only the overlay's box, clipped to the frame
+        box_h, box_w = inv_alpha.shape[:2]
+        frame_h, frame_w = frame.shape[:2]
+        fx0, fy0 = max(x0, 0), max(y0, 0)
+        fx1, fy1 = min(x0 + box_w, frame_w), min(y0 + box_h, frame_h)
+        if fx1 <= fx0 or fy1 <= fy0:
+            return frame
+        
+        layer = (slice(fy0 - y0, fy1 - y0), slice(fx0 - x0, fx1 - x0))
+        roi = frame[fy0:fy1, fx0:fx1]
+        roi[:] = (roi * inv_alpha[layer] + premultiplied[layer]).astype(np.uint8)
         
         return frame
+
+    def _text_overlay_layer(self, text: str, position: tuple, font_scale: float):
+        """
+        Cached overlay for a caption: a 30% black box with opaque white text.
+        Returns (x0, y0, 1 - alpha, rgb * alpha) for the box region.
+        """
+        key = (text, position, font_scale)
+        layer = self._overlay_cache.get(key)
+        if layer is not None:
+            return layer
+        
+        text_w, text_h = _text_size(text, font_scale, 2)
+        x0 = position[0] - 10
+        y0 = position[1] - text_h - 10
+        
+        text_mask = np.zeros((text_h + 20, text_w + 20), dtype=np.uint8)
+        cv2.putText(text_mask, text, (10, text_h + 10), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 255, 2)
+        is_text = (text_mask > 0)[..., None]
+        
+        alpha = np.where(is_text, 1.0, 0.3).astype(np.float32)
+        premultiplied = np.where(is_text, 255.0, 0.0).astype(np.float32)
+        layer = (x0, y0, 1.0 - alpha, premultiplied)
+        
+        if len(self._overlay_cache) >= 256:
+            self._overlay_cache.clear()
+        self._overlay_cache[key] = layer
+        return layer
@@ -1,13 +1,156 @@
 import google.generativeai as genai
+import atexit
+import collections
+import hashlib
+import multiprocessing
 import os
+import queue
+import shutil
 import subprocess
+import threading
+import time
 import logging
 from pathlib import Path
-from config import GEMINI_CONFIG, VIDEOS_DIR
+from typing import Optional, Sequence, Union
+from config import GEMINI_CONFIG, MANIM_CONFIG, VIDEOS_DIR
+
+from .encoder import link_or_copy
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+def _find_ffmpeg() -> Optional[str]:
+    """Locate ffmpeg on PATH, or at the FFMPEG_PATH environment variable"""
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        return ffmpeg_path
+    
+    ffmpeg_path = os.environ.get("FFMPEG_PATH")
+    if ffmpeg_path and os.path.exists(ffmpeg_path):
+        print(f"[MANIM] FFmpeg found at {ffmpeg_path}, configuring...")
+        # Also add to PATH for subprocess calls
+        os.environ["PATH"] += os.pathsep + os.path.dirname(ffmpeg_path)
+        return ffmpeg_path
+    return None
+
+
+# Resolved once per process rather than on every ManimCodeGenerator()
+_FFMPEG_PATH = _find_ffmpeg()
+
+
+def _manim_worker(jobs, results):
+    """
+    Render process loop: manim is imported once, then each job renders
+    ConceptScene from a script file in-process, until a None job arrives
+    """
+    import importlib.util
+    import traceback
+    import manim  # the expensive import, paid once per worker
+    
+    if _FFMPEG_PATH and _FFMPEG_PATH == os.environ.get("FFMPEG_PATH"):
+        manim.config.ffmpeg_executable = _FFMPEG_PATH
+    
+    job = jobs.get()
+    while job is not None:
+        scene_file, media_dir, video_id = job
+        try:
+            spec = importlib.util.spec_from_file_location(Path(scene_file).stem, scene_file)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            
+            # Same settings and output layout as the `manim -ql ... -o` CLI call
+            options = {
+                "quality": "low_quality",
+                "media_dir": media_dir,
+                "input_file": scene_file,
+                "output_file": video_id,
+                "renderer": MANIM_CONFIG["renderer"],
+                "disable_caching": MANIM_CONFIG["disable_caching"],
+                "write_to_movie": True,
+                "progress_bar": "none",
+                "verbosity": "WARNING",
+            }
+            with manim.tempconfig(options):
+                module.ConceptScene().render()
+            results.put((True, None))
+        except Exception:
+            results.put((False, traceback.format_exc()))
+        job = jobs.get()
+
+
+class ManimWorkerPool:
+    """
+    Persistent render processes with manim already imported, so a render
+    does not pay the manim/cairo/pango start-up of a fresh `manim` CLI.
+    Generated scripts run inside the worker, so a worker is replaced after
+    a failed render (state it left behind is suspect) and after max_jobs
+    renders, bounding how long leaked module or config state can live.
+    A worker that hangs or dies is killed and replaced.
+    """
+    
+    def __init__(self, size: int, max_jobs: int):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._max_jobs = max_jobs
+        for _ in range(size):
+            self._idle.put(self._spawn())
+        atexit.register(self.shutdown)
+        print(f"[MANIM] Started {size} render worker(s)")
+    
+    def _spawn(self):
+        jobs = self._ctx.Queue()
+        results = self._ctx.Queue()
+        process = self._ctx.Process(target=_manim_worker, args=(jobs, results), daemon=True)
+        process.start()
+        return process, jobs, results, 0
+    
+    def _retire(self, worker):
+        process, jobs, _, _ = worker
+        if process.is_alive():
+            jobs.put(None)
+            process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    
+    def render(self, scene_file: Path, media_dir: Path, video_id: str, timeout: int = 300) -> bool:
+        """Render scene_file on an idle worker; False on failure or timeout"""
+        worker = self._idle.get()
+        process, jobs, results, jobs_done = worker
+        ok = False
+        try:
+            jobs.put((str(scene_file), str(media_dir), video_id))
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    ok, error = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if process.is_alive() and time.monotonic() < deadline:
+                        continue
+                    print("[MANIM] Render timed out or worker died, restarting worker")
+                    return False
+            
+            if not ok:
+                print(f"[MANIM] Render failed:\n{error}")
+            return ok
+        finally:
+            jobs_done += 1
+            if ok and jobs_done < self._max_jobs:
+                self._idle.put((process, jobs, results, jobs_done))
+            else:
+                self._retire(worker)
+                self._idle.put(self._spawn())
+    
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._retire(worker)
+
+
 class ManimCodeGenerator:
     """
     Generates educational videos using Manim (Mathematical Animation Engine)
@@ -21,24 +164,36 @@ class ManimCodeGenerator:
         
         # Configure FFmpeg path explicitly for Manim
         from manim import config
-        import shutil
         
-        if not shutil.which("ffmpeg"):
-            # Try to locate it in common Winget location
-            ffmpeg_path = r"C:\Users\pk\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0.1-full_build\bin\ffmpeg.exe"
-            if os.path.exists(ffmpeg_path):
-                print(f"[MANIM] FFmpeg found at {ffmpeg_path}, configuring...")
-                config.ffmpeg_executable = ffmpeg_path
-                # Also add to PATH for subprocess calls
-                os.environ["PATH"] += os.pathsep + os.path.dirname(ffmpeg_path)
-            else:
-                 print("[MANIM] WARNING: FFmpeg not found in path or default location.")
+        self.ffmpeg_path = _FFMPEG_PATH
+        if self.ffmpeg_path and self.ffmpeg_path == os.environ.get("FFMPEG_PATH"):
+            # Not on the original PATH: point Manim at it explicitly
+            config.ffmpeg_executable = self.ffmpeg_path
+        elif not self.ffmpeg_path:
+            print("[MANIM] WARNING: FFmpeg not found in PATH or FFMPEG_PATH.")
         
-    def generate_video(self, topic: str, explanation: str, video_id: str) -> str:
+        # Workers import manim while Gemini writes the first script
+        workers = MANIM_CONFIG["workers"]
+        self.worker_pool = ManimWorkerPool(workers, MANIM_CONFIG["worker_max_jobs"]) if workers > 0 else None
+        
+    def generate_video(self, topic: str, explanation: Union[str, Sequence[str]], video_id: str) -> str:
         """
         Main pipeline: Generate Manim code -> Render video
+        explanation is the answer text or the list of script scenes.
         """
         try:
+            if not isinstance(explanation, str):
+                # Script scenes: joined here so the text fallback never pays for it
+                explanation = "\n".join(explanation)
+            
+            # Same concept asked before: reuse the rendered video
+            cache_path = self._cache_path(topic, explanation)
+            final_path = Path(VIDEOS_DIR) / f"{video_id}.mp4"
+            if cache_path.exists():
+                link_or_copy(cache_path, final_path)
+                print(f"[MANIM] Cache hit, reused {cache_path.name}")
+                return str(final_path)
+            
             print(f"[MANIM] Generating code for: {topic}")
             manim_code = self._generate_manim_code(topic, explanation)
             
@@ -46,17 +201,27 @@ class ManimCodeGenerator:
                 print("[MANIM] Failed to generate code")
                 return None
                 
-            return self._render_manim(manim_code, video_id)
+            video_path = self._render_manim(manim_code, video_id)
+            if video_path:
+                try:
+                    link_or_copy(Path(video_path), cache_path)
+                except OSError as e:
+                    print(f"[MANIM] Could not cache video: {e}")
+            return video_path
             
         except Exception as e:
             print(f"[MANIM] Error in generation pipeline: {e}")
             return None
 
-    def _generate_manim_code(self, topic: str, explanation: str) -> str:
-        """
-        Prompt Gemini to write a robust Manim script
-        """
-        prompt = f"""
+    def _cache_path(self, topic: str, explanation: str) -> Path:
+        """Cache file for a concept; keyed on exactly what the prompt uses"""
+        key = hashlib.blake2b(
+            (topic + "\n" + explanation[:800]).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return Path(VIDEOS_DIR) / f"cache_{key}.mp4"
+
+    def _build_manim_prompt(self, topic: str, explanation: str) -> str:
+        return f"""
         Act as an expert Manim (Python) developer.
         Write a COMPLETE, RUNNABLE Manim script to explain this concept:
         
@@ -81,13 +246,31 @@ class ManimCodeGenerator:
         
         Output valid Python code only.
         """
-        
+
+    def _clean_code(self, response_text: str) -> str:
+        code = response_text.strip()
+        # Clean markdown if present
+        return code.replace("```python", "").replace("```", "").strip()
+
+    def _generate_manim_code(self, topic: str, explanation: str) -> str:
+        """
+        Prompt Gemini to write a robust Manim script
+        """
         try:
-            response = self.model.generate_content(prompt)
-            code = response.text.strip()
-            # Clean markdown if present
-            code = code.replace("```python", "").replace("```", "").strip()
-            return code
+            response = self.model.generate_content(self._build_manim_prompt(topic, explanation))
+            return self._clean_code(response.text)
+        except Exception as e:
+            print(f"[MANIM] Generator error: {e}")
+            return None
+
+    async def generate_code_async(self, topic: str, explanation: str) -> str:
+        """
+        Async variant of _generate_manim_code, so code generation can be
+        awaited alongside other Gemini calls (e.g. generate_script_async)
+        """
+        try:
+            response = await self.model.generate_content_async(self._build_manim_prompt(topic, explanation))
+            return self._clean_code(response.text)
         except Exception as e:
             print(f"[MANIM] Generator error: {e}")
             return None
@@ -105,30 +288,13 @@ class ManimCodeGenerator:
             
         print(f"[MANIM] Saved script to {scene_file}")
         
-        # Build command: manim -qm --media_dir ...
-        # -ql = Low quality (480p) for speed, -qm = Medium (720p)
-        cmd = [
-            "manim",
-            "-ql",  # Use Low quality for speed testing first, or -qm
-            "--media_dir", str(output_dir),
-            "-o", f"{video_id}.mp4", # Output filename
-            str(scene_file),
-            "ConceptScene"
-        ]
-        
         print(f"[MANIM] Rendering video... (This may take time)")
         try:
-            # Run manim command
-            process = subprocess.run(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=300 # 5 min timeout
-            )
-            
-            if process.returncode != 0:
-                print(f"[MANIM] Render failed:\n{process.stderr}")
+            if self.worker_pool:
+                rendered = self.worker_pool.render(scene_file, output_dir, video_id)
+            else:
+                rendered = self._run_manim_cli(scene_file, output_dir, video_id)
+            if not rendered:
                 return None
                 
             # Manim output structure is typically: media_dir/videos/scene_file_name/quality/filename.mp4
@@ -141,29 +307,72 @@ class ManimCodeGenerator:
             # We need to find where it actually landed.
             
             # Simple finder:
-            expected_path = output_dir / "videos" / f"manim_{video_id}" / "480p15" / f"{video_id}.mp4"
-            if expected_path.exists():
-                # Move to main videos dir for serving
-                final_path = output_dir / f"{video_id}.mp4"
-                import shutil
-                shutil.move(str(expected_path), str(final_path))
-                print(f"[MANIM] Video moved to {final_path}")
-                return str(final_path)
+            scene_dir = output_dir / "videos" / f"manim_{video_id}"
+            expected_path = scene_dir / "480p15" / f"{video_id}.mp4"
+            if not expected_path.exists():
+                # Quality folder differs from -ql's default: look only inside this scene's folder
+                expected_path = next(scene_dir.glob(f"*/{video_id}.mp4"), None)
             
-            # Search recursively if path logic failed
-            found = list(output_dir.rglob(f"{video_id}.mp4"))
-            if found:
+            if expected_path:
+                # Move to main videos dir for serving (same filesystem: a rename, no copy)
                 final_path = output_dir / f"{video_id}.mp4"
-                import shutil
-                shutil.move(str(found[0]), str(final_path))
+                os.replace(expected_path, final_path)
+                print(f"[MANIM] Video moved to {final_path}")
                 return str(final_path)
                 
             print("[MANIM] Video file not found after success return code")
             return None
             
-        except subprocess.TimeoutExpired:
-            print("[MANIM] Render timed out")
-            return None
         except Exception as e:
             print(f"[MANIM] Execution error: {e}")
             return None
+
+    def _run_manim_cli(self, scene_file: Path, output_dir: Path, video_id: str) -> bool:
+        """Render with a fresh `manim` process (used when no worker pool is configured)"""
+        # Build command: manim -qm --media_dir ...
+        # -ql = Low quality (480p) for speed, -qm = Medium (720p)
+        cmd = [
+            "manim",
+            "-ql",  # Use Low quality for speed testing first, or -qm
+            "--media_dir", str(output_dir),
+            "-o", f"{video_id}.mp4", # Output filename
+            "--renderer", MANIM_CONFIG["renderer"],
+        ]
+        if MANIM_CONFIG["renderer"] == "opengl":
+            # The OpenGL renderer only writes a file when asked to
+            cmd.append("--write_to_movie")
+        if MANIM_CONFIG["disable_caching"]:
+            cmd.append("--disable_caching")
+        cmd += [str(scene_file), "ConceptScene"]
+        
+        # Run manim command, streaming its (verbose) stderr instead of
+        # buffering all of it; only the tail is kept for error reports
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        stderr_tail = collections.deque(maxlen=200)
+        
+        def drain_stderr():
+            for line in process.stderr:
+                logger.debug(line.rstrip())
+                stderr_tail.append(line)
+        
+        reader = threading.Thread(target=drain_stderr, daemon=True)
+        reader.start()
+        try:
+            process.wait(timeout=300) # 5 min timeout
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            print("[MANIM] Render timed out")
+            return False
+        finally:
+            reader.join(timeout=5)
+        
+        if process.returncode != 0:
+            print(f"[MANIM] Render failed:\n{''.join(stderr_tail)}")
+            return False
+        return True
@@ -8,6 +8,38 @@ from pathlib import Path
 from typing import List, Optional, Tuple
 import re
 import math
+import functools
+
+from config import ANIMATOR_CONFIG
+from .encoder import discard_video_writer, open_video_writer
+
+
+@functools.lru_cache(maxsize=32)
+def _wrap_lines(text: str, max_chars: int = 85, max_lines: int = 10) -> Tuple[str, ...]:
+    """Word-wrap text into at most max_lines lines (cached: same text every frame)"""
+    words = text.split()
+    lines = []
+    current_line = []
+    
+    for word in words:
+        test_line = " ".join(current_line + [word])
+        if len(test_line) <= max_chars:
+            current_line.append(word)
+        else:
+            if current_line:
+                lines.append(" ".join(current_line))
+            current_line = [word]
+    
+    if current_line:
+        lines.append(" ".join(current_line))
+    
+    return tuple(lines[:max_lines])
+
+
+@functools.lru_cache(maxsize=32)
+def _extract_numbers(text: str) -> Tuple[str, ...]:
+    """All integers in text (cached: same text every frame)"""
+    return tuple(re.findall(r'\d+', text))
 
 
 class EnhancedVideoGenerator:
@@ -24,16 +56,31 @@ class EnhancedVideoGenerator:
         self.success_color = (50, 255, 120)  # Bright green
         self.warning_color = (255, 180, 50)  # Golden orange
         
+        # Background template and the frame buffer every frame is drawn into
+        self._background = np.full((self.height, self.width, 3), self.bg_color, dtype=np.uint8)
+        self._frame_buf = np.empty_like(self._background)
+        self._title_layer = None  # (title, first row, rows of the full-opacity title band)
+        # Key of the static frame the buffer still holds (None: last frame was animated)
+        self._held_key = None
+        
+    def _blank_frame(self) -> np.ndarray:
+        """Reset the shared frame buffer to the background and return it"""
+        self._held_key = None
+        np.copyto(self._frame_buf, self._background)
+        return self._frame_buf
+        
     def generate_video(
         self,
         topic: str,
         explanation: str,
         formulas: List[str] = None,
         video_id: str = None,
-        duration: int = 15
+        duration: int = 15,
+        fps: int = None
     ) -> Optional[str]:
-        """Generate an educational animation video"""
+        """Generate an educational animation video (at self.fps unless fps is given)"""
         try:
+            fps = fps or self.fps
             if video_id is None:
                 import uuid
                 video_id = str(uuid.uuid4())[:8]
@@ -41,47 +88,31 @@ class EnhancedVideoGenerator:
             filename = f"{video_id}.mp4"
             output_path = self.videos_dir / filename
             
-            # Create video writer
-            # Create video writer (Use avc1 for better browser compatibility)
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*'avc1')
-            except:
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(
-                str(output_path),
-                fourcc,
-                self.fps,
-                (self.width, self.height)
+            # Create video writer (hardware H.264 when available)
+            out = open_video_writer(
+                str(output_path), fps, (self.width, self.height),
+                use_nvenc=ANIMATOR_CONFIG["backend"] == "nvenc"
             )
-            
-            # Detect the type of content
-            animation_type = self._detect_animation_type(topic, explanation, formulas)
-            
-            total_frames = duration * self.fps
-            
-            # Generate frames based on type
-            for frame_num in range(total_frames):
-                progress = frame_num / total_frames
+            try:
+                # Detect the type of content
+                animation_type = self._detect_animation_type(topic, explanation, formulas)
+                
+                total_frames = duration * fps
                 
-                if animation_type == "math_addition":
-                    frame = self._create_math_addition_frame(
-                        frame_num, total_frames, topic, explanation, formulas
-                    )
-                elif animation_type == "math_formula":
-                    frame = self._create_formula_explanation_frame(
-                        frame_num, total_frames, topic, explanation, formulas
-                    )
-                elif animation_type == "theorem":
-                    frame = self._create_theorem_frame(
-                        frame_num, total_frames, topic, explanation, formulas
-                    )
-                else:
-                    # Default: step-by-step explanation
-                    frame = self._create_step_by_step_frame(
-                        frame_num, total_frames, topic, explanation, formulas
-                    )
+                # Pick the frame builder once instead of re-dispatching per frame
+                frame_builders = {
+                    "math_addition": self._create_math_addition_frame,
+                    "math_formula": self._create_formula_explanation_frame,
+                    "theorem": self._create_theorem_frame,
+                }
+                # Default: step-by-step explanation
+                create_frame = frame_builders.get(animation_type, self._create_step_by_step_frame)
                 
-                out.write(frame)
+                for frame_num in range(total_frames):
+                    out.write(create_frame(frame_num, total_frames, topic, explanation, formulas))
+            except Exception:
+                discard_video_writer(out, str(output_path))
+                raise
             
             out.release()
             print(f"✅ Enhanced video generated: {output_path}")
@@ -117,11 +148,11 @@ class EnhancedVideoGenerator:
         topic: str, explanation: str, formulas: List[str]
     ) -> np.ndarray:
         """Create frame for math addition/subtraction with visual objects"""
-        frame = np.full((self.height, self.width, 3), self.bg_color, dtype=np.uint8)
+        frame = self._blank_frame()
         progress = frame_num / total_frames
         
         # Extract numbers from topic or explanation
-        numbers = re.findall(r'\d+', topic + " " + explanation)
+        numbers = _extract_numbers(topic + " " + explanation)
         
         if len(numbers) >= 2:
             num1 = int(numbers[0])
@@ -135,14 +166,14 @@ class EnhancedVideoGenerator:
             
             # Stage 2: Show first group of objects (15-35%)
             elif progress < 0.35:
-                self._draw_title(frame, topic, 1.0)
+                self._draw_full_title(frame, topic)
                 section_progress = (progress - 0.15) / 0.2
                 self._draw_objects_group(frame, num1, 400, 450, section_progress, "First Group")
                 self._draw_large_number(frame, str(num1), 400, 750, section_progress)
             
             # Stage 3: Show plus sign (35-45%)
             elif progress < 0.45:
-                self._draw_title(frame, topic, 1.0)
+                self._draw_full_title(frame, topic)
                 self._draw_objects_group(frame, num1, 400, 450, 1.0, "First Group")
                 self._draw_large_number(frame, str(num1), 400, 750, 1.0)
                 section_progress = (progress - 0.35) / 0.1
@@ -150,7 +181,7 @@ class EnhancedVideoGenerator:
             
             # Stage 4: Show second group (45-65%)
             elif progress < 0.65:
-                self._draw_title(frame, topic, 1.0)
+                self._draw_full_title(frame, topic)
                 self._draw_objects_group(frame, num1, 400, 450, 1.0, "First Group")
                 self._draw_large_number(frame, str(num1), 400, 750, 1.0)
                 self._draw_operator(frame, "+", self.width // 2, 600, 1.0)
@@ -160,7 +191,7 @@ class EnhancedVideoGenerator:
             
             # Stage 5: Combine and show result (65-85%)
             elif progress < 0.85:
-                self._draw_title(frame, topic, 1.0)
+                self._draw_full_title(frame, topic)
                 section_progress = (progress - 0.65) / 0.2
                 
                 # Move objects together
@@ -274,7 +305,7 @@ class EnhancedVideoGenerator:
         topic: str, explanation: str, formulas: List[str]
     ) -> np.ndarray:
         """Create frame explaining a formula step by step"""
-        frame = np.full((self.height, self.width, 3), self.bg_color, dtype=np.uint8)
+        frame = self._blank_frame()
         progress = frame_num / total_frames
         
         # Stage 1: Title (0-15%)
@@ -284,14 +315,14 @@ class EnhancedVideoGenerator:
         
         # Stage 2: Show formula (15-40%)
         elif progress < 0.40:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             section_progress = (progress - 0.15) / 0.25
             if formulas:
                 self._draw_centered_formula(frame, formulas[0], 300, section_progress)
         
         # Stage 3: Explanation (40-80%)
         elif progress < 0.80:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             if formulas:
                 self._draw_centered_formula(frame, formulas[0], 200, 1.0)
             section_progress = (progress - 0.40) / 0.40
@@ -310,12 +341,19 @@ class EnhancedVideoGenerator:
         topic: str, explanation: str, formulas: List[str]
     ) -> np.ndarray:
         """Create frame for theorems with diagrams"""
-        frame = np.full((self.height, self.width, 3), self.bg_color, dtype=np.uint8)
         progress = frame_num / total_frames
         
         # For Pythagorean theorem, draw a triangle
         if "pythag" in topic.lower():
-            return self._create_pythagorean_frame(frame, frame_num, total_frames, topic, explanation, formulas)
+            # Without formulas stage 3 is a still: re-emit the frame already in the buffer
+            static_key = ("pythagorean", topic) if 0.50 <= progress < 0.75 and not formulas else None
+            if static_key and self._held_key == static_key:
+                return self._frame_buf
+            frame = self._create_pythagorean_frame(
+                self._blank_frame(), frame_num, total_frames, topic, explanation, formulas
+            )
+            self._held_key = static_key
+            return frame
         
         # Default theorem visualization
         return self._create_step_by_step_frame(frame_num, total_frames, topic, explanation, formulas)
@@ -334,13 +372,13 @@ class EnhancedVideoGenerator:
         
         # Stage 2: Draw triangle
         elif progress < 0.50:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             section_progress = (progress - 0.15) / 0.35
             self._draw_right_triangle(frame, section_progress)
         
         # Stage 3: Show formula
         elif progress < 0.75:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             self._draw_right_triangle(frame, 1.0)
             section_progress = (progress - 0.50) / 0.25
             if formulas:
@@ -401,9 +439,14 @@ class EnhancedVideoGenerator:
         topic: str, explanation: str, formulas: List[str]
     ) -> np.ndarray:
         """Create default step-by-step explanation frame"""
-        frame = np.full((self.height, self.width, 3), self.bg_color, dtype=np.uint8)
         progress = frame_num / total_frames
         
+        # Without formulas stage 3 is a still: re-emit the frame already in the buffer
+        static_key = ("step_by_step", topic, explanation) if 0.7 <= progress < 0.9 and not formulas else None
+        if static_key and self._held_key == static_key:
+            return self._frame_buf
+        frame = self._blank_frame()
+        
         # Stage 1: Title
         if progress < 0.2:
             alpha = progress / 0.2
@@ -411,17 +454,18 @@ class EnhancedVideoGenerator:
         
         # Stage 2: Explanation
         elif progress < 0.7:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             section_progress = (progress - 0.2) / 0.5
             self._draw_wrapped_explanation(frame, explanation, 300, section_progress)
         
         # Stage 3: Formula (if available)
         elif progress < 0.9:
-            self._draw_title(frame, topic, 1.0)
+            self._draw_full_title(frame, topic)
             self._draw_wrapped_explanation(frame, explanation, 200, 1.0)
             if formulas:
                 section_progress = (progress - 0.7) / 0.2
                 self._draw_centered_formula(frame, formulas[0], 550, section_progress)
+            self._held_key = static_key
         
         # Stage 4: Conclusion
         else:
@@ -430,6 +474,25 @@ class EnhancedVideoGenerator:
         
         return frame
     
+    def _draw_full_title(self, frame: np.ndarray, title: str):
+        """
+        Draw the fully faded-in title onto a blank frame by copying a cached
+        pre-rendered band, instead of re-rasterizing it every frame.
+        Only the rows the title touches are copied; the rest of the frame
+        already is background. Must be the first thing drawn on the frame.
+        """
+        if self._title_layer is None or self._title_layer[0] != title:
+            layer = self._background.copy()
+            self._draw_title(layer, title, 1.0)
+            rows = np.flatnonzero((layer != self._background).any(axis=(1, 2)))
+            if len(rows):
+                y0, y1 = rows[0], rows[-1] + 1
+            else:
+                y0 = y1 = 0
+            self._title_layer = (title, y0, layer[y0:y1].copy())
+        _, y0, band = self._title_layer
+        frame[y0:y0 + len(band)] = band
+
     def _draw_title(self, frame: np.ndarray, title: str, alpha: float):
         """Draw title with fade-in"""
         if len(title) > 50:
@@ -458,24 +521,7 @@ class EnhancedVideoGenerator:
     
     def _draw_wrapped_explanation(self, frame: np.ndarray, text: str, start_y: int, alpha: float):
         """Draw explanation text with word wrapping"""
-        words = text.split()
-        lines = []
-        current_line = []
-        max_chars = 85
-        
-        for word in words:
-            test_line = " ".join(current_line + [word])
-            if len(test_line) <= max_chars:
-                current_line.append(word)
-            else:
-                if current_line:
-                    lines.append(" ".join(current_line))
-                current_line = [word]
-        
-        if current_line:
-            lines.append(" ".join(current_line))
-        
-        lines = lines[:10]  # Max 10 lines
+        lines = _wrap_lines(text)
         
         num_lines_to_show = min(len(lines), int(len(lines) * alpha) + 1)
         
@@ -510,15 +556,15 @@ class EnhancedVideoGenerator:
         
         color = tuple(int(c * alpha) for c in self.success_color)
         
-        # Box background
+        # Box background: blend only the box region (the rest of the frame is unchanged)
         padding = 25
-        box_alpha = int(100 * alpha)
-        overlay = frame.copy()
-        cv2.rectangle(overlay,
-                     (x - padding, y - 40),
-                     (x + text_size[0] + padding, y + 15),
-                     (50, 50, 70), -1)
-        cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
+        x0, y0 = max(x - padding, 0), max(y - 40, 0)
+        x1, y1 = min(x + text_size[0] + padding + 1, self.width), min(y + 16, self.height)
+        if x1 > x0 and y1 > y0:
+            box = frame[y0:y1, x0:x1]
+            fill = np.empty_like(box)
+            fill[:] = (50, 50, 70)
+            cv2.addWeighted(fill, 0.7, box, 0.3, 0, box)
         
         # Box border
         cv2.rectangle(frame,
@@ -1,19 +1,26 @@
 """
 Script Generator - Converts answer text into an animated story script
 """
+import threading
 from typing import List
 import google.generativeai as genai
 from config import GEMINI_CONFIG
 
-def generate_script(answer_text: str) -> List[str]:
-    """
-    Convert answer text into a 3-part animated story script using Gemini.
-    """
-    try:
-        genai.configure(api_key=GEMINI_CONFIG["api_key"])
-        model = genai.GenerativeModel(GEMINI_CONFIG["model"])
-        
-        prompt = f"""
+_MODEL = None
+_MODEL_LOCK = threading.Lock()
+
+def _get_model() -> genai.GenerativeModel:
+    """Configure Gemini and build the model once per process"""
+    global _MODEL
+    if _MODEL is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                genai.configure(api_key=GEMINI_CONFIG["api_key"])
+                _MODEL = genai.GenerativeModel(GEMINI_CONFIG["model"])
+    return _MODEL
+
+def _build_script_prompt(answer_text: str) -> str:
+    return f"""
         You are a screenwriter for a 3D animated educational series (Pixar style).
         Convert this educational answer into a short 3-scene story script.
         
@@ -31,11 +38,36 @@ def generate_script(answer_text: str) -> List[str]:
         Paragraph 2 (Scene 2 Description)
         Paragraph 3 (Scene 3 Description)
         """
+
+def _parse_script(response_text: str) -> List[str]:
+    scenes = [p.strip() for p in response_text.split('\n\n') if p.strip()]
+    return scenes[:3] if len(scenes) >= 3 else scenes
+
+def generate_script(answer_text: str) -> List[str]:
+    """
+    Convert answer text into a 3-part animated story script using Gemini.
+    """
+    try:
+        model = _get_model()
         
-        response = model.generate_content(prompt)
-        scenes = [p.strip() for p in response.text.split('\n\n') if p.strip()]
+        response = model.generate_content(_build_script_prompt(answer_text))
+        return _parse_script(response.text)
+        
+    except Exception as e:
+        print(f"[SCRIPT GEN] Error transforming script: {e}")
+        # Fallback to simple splitting
+        return [answer_text]
+
+async def generate_script_async(answer_text: str) -> List[str]:
+    """
+    Async variant of generate_script: awaits Gemini instead of blocking the
+    calling thread, so it can run concurrently with other LLM calls.
+    """
+    try:
+        model = _get_model()
         
-        return scenes[:3] if len(scenes) >= 3 else scenes
+        response = await model.generate_content_async(_build_script_prompt(answer_text))
+        return _parse_script(response.text)
         
     except Exception as e:
         print(f"[SCRIPT GEN] Error transforming script: {e}")
@@ -2,67 +2,256 @@
 Video Generator - Generates videos using AI images
 Hybrid approach: AI-generated images + OpenCV animation
 """
+import asyncio
 import cv2
+import functools
+import hashlib
+import logging
 import numpy as np
+import os
+import threading
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal, Optional
 from pathlib import Path
-from config import VIDEOS_DIR
+from config import VIDEO_PROFILES, VIDEOS_DIR
 
-# Import AI modules
-try:
-    from .manim_generator import ManimCodeGenerator
-    MANIM_AVAILABLE = True 
-except ImportError as e:
-    MANIM_AVAILABLE = False
-    print(f"[VIDEO PIPELINE] Manim module not available: {e}")
+from .encoder import best_fourcc, link_or_copy, select_ffmpeg_encoder
+
+logger = logging.getLogger(__name__)
+
+# Resolved once instead of on every request
+_VIDEOS_DIR_PATH = Path(VIDEOS_DIR)
+
+# Answers below either limit go straight to the text renderer
+SHORT_ANSWER_WORDS = 40
+SHORT_ANSWER_CHARS = 250
+
+# Backends tried for each strategy, in order, until one produces a video
+STRATEGY_FALLBACKS = {
+    "manim": ("manim", "text"),
+    "ai_images": ("ai_images", "text"),
+    "text": ("text",),
+}
+
+
+# Marks a lazily loaded backend that has not been loaded yet (None means unavailable)
+_UNSET = object()
+
+
+def _profile_for(video_id: str) -> dict:
+    """Output profile of the first VIDEO_PROFILES prefix video_id starts with"""
+    for prefix, profile in VIDEO_PROFILES.items():
+        if prefix != "default" and video_id.startswith(prefix):
+            return profile
+    return VIDEO_PROFILES["default"]
 
 
 class HybridVideoGenerator:
-    """Generates videos using Manim (Primary) or OpenCV text (Fallback)"""
+    """Generates videos using Manim (Primary), AI images, or OpenCV text (Fallback)"""
     
     def __init__(self):
-        # Initialize text generator (Fallback)
+        # Backends load on first use. The frame renderers own scratch buffers,
+        # so those are kept per worker thread rather than shared.
+        self._local = threading.local()
+        
+        # (sha256 of a short explanation, fps) -> text video already rendered for it
+        self._text_video_cache = {}
+        
+        # Manim starts render workers, so the warm-up thread and a first request
+        # must not both build it
+        self._manim_gen = _UNSET
+        self._manim_lock = threading.Lock()
+
+    @property
+    def manim_gen(self):
+        """Manim backend, or None when Manim is not installed or fails to start"""
+        if self._manim_gen is _UNSET:
+            with self._manim_lock:
+                if self._manim_gen is _UNSET:
+                    self._manim_gen = self._load_manim()
+        return self._manim_gen
+
+    def _load_manim(self):
         try:
-            from .opencv_text_generator import EnhancedVideoGenerator
-            self.text_gen = EnhancedVideoGenerator(Path(VIDEOS_DIR))
-        except:
-            self.text_gen = None
+            from .manim_generator import ManimCodeGenerator
+            manim_gen = ManimCodeGenerator()
+            logger.info("[VIDEO PIPELINE] Manim Generator initialized")
+            return manim_gen
+        except ImportError as e:
+            logger.warning("[VIDEO PIPELINE] Manim module not available: %s", e)
+        except Exception as e:
+            logger.warning("[VIDEO PIPELINE] Failed to initialize Manim: %s", e)
+        return None
 
-        self.use_manim = MANIM_AVAILABLE
-        if self.use_manim:
+    @functools.cached_property
+    def image_gen(self):
+        """AI scene image backend"""
+        from .ai_image_generator import AIImageGenerator
+        return AIImageGenerator()
+
+    @property
+    def text_gen(self):
+        """This thread's OpenCV text renderer, or None when it cannot be loaded"""
+        if not hasattr(self._local, "text_gen"):
             try:
-                self.manim_gen = ManimCodeGenerator()
-                print("[VIDEO PIPELINE] Manim Generator initialized")
-            except Exception as e:
-                print(f"[VIDEO PIPELINE] Failed to initialize Manim: {e}")
-                self.use_manim = False
+                from .opencv_text_generator import EnhancedVideoGenerator
+                self._local.text_gen = EnhancedVideoGenerator(_VIDEOS_DIR_PATH)
+            except:
+                self._local.text_gen = None
+        return self._local.text_gen
+
+    @property
+    def animator(self):
+        """This thread's image-to-video animator"""
+        if not hasattr(self._local, "animator"):
+            from .image_to_video import ImageToVideoAnimator
+            self._local.animator = ImageToVideoAnimator()
+        return self._local.animator
         
-    def create_video_from_answer(self, answer_text: str, video_id: str, script_scenes: List[str] = None) -> str:
+    def create_video_from_answer(
+        self,
+        answer_text: str,
+        video_id: str,
+        script_scenes: List[str] = None,
+        strategy: Optional[Literal["manim", "ai_images", "text"]] = None
+    ) -> str:
         """
-        Create video using Manim
+        Create video with the chosen strategy, falling back to the text video.
+        Without an explicit strategy, short answers go straight to text and
+        everything else tries Manim first.
         """
         topic = "Explanation"
-        if script_scenes:
-            # Join script for context (Manim needs the full flow)
-            explanation = "\n".join(script_scenes)
-        else:
-            explanation = answer_text
-            
-        if self.use_manim:
-            print(f"[VIDEO PIPELINE] Attempting Manim render for {video_id}...")
-            video_path = self.manim_gen.generate_video(topic, explanation, video_id)
-            
+        # Scenes are joined by whichever backend ends up rendering them
+        scenes = script_scenes or [answer_text]
+        
+        # A sentence or two reads fine as a text video; skip the heavy backends entirely
+        if strategy is None:
+            word_count = sum(len(scene.split()) for scene in scenes)
+            char_count = sum(map(len, scenes)) + len(scenes) - 1
+            if self.text_gen and (word_count < SHORT_ANSWER_WORDS or char_count < SHORT_ANSWER_CHARS):
+                logger.debug("[VIDEO PIPELINE] Short answer, rendering text video for %s", video_id)
+                return self._create_short_text_video(topic, "\n".join(scenes), video_id)
+            strategy = "manim"
+        
+        for backend in STRATEGY_FALLBACKS[strategy]:
+            video_path = self._render_with(backend, topic, scenes, video_id)
             if video_path:
-                print(f"[VIDEO PIPELINE] ✅ Manim video created: {video_path}")
                 return video_path
-            
-        # Fallback
-        print("[VIDEO PIPELINE] Manim failed or unavailable. Using standard text video.")
+            logger.debug("[VIDEO PIPELINE] %s failed or unavailable.", backend)
+        return None
+
+    def _render_with(self, backend: str, topic: str, scenes: List[str], video_id: str) -> str:
+        """Render with one backend; None when it is unavailable or fails"""
+        if backend == "manim":
+            if self.manim_gen is None:
+                return None
+            logger.debug("[VIDEO PIPELINE] Attempting Manim render for %s...", video_id)
+            video_path = self.manim_gen.generate_video(topic, scenes, video_id)
+            if video_path:
+                logger.debug("[VIDEO PIPELINE] Manim video created: %s", video_path)
+            return video_path
+        
+        if backend == "ai_images":
+            return self.create_ai_image_video("\n".join(scenes), video_id)
+        
+        logger.debug("[VIDEO PIPELINE] Using standard text video.")
         if self.text_gen:
-            return self.text_gen.generate_video(topic, explanation, video_id=video_id)
+            fps = _profile_for(video_id)["fps"]
+            return self.text_gen.generate_video(topic, "\n".join(scenes), video_id=video_id, fps=fps)
         return None
 
+    def _create_short_text_video(self, topic: str, explanation: str, video_id: str) -> str:
+        """Text video for a short answer, reusing an earlier render of the same text"""
+        fps = _profile_for(video_id)["fps"]
+        key = (hashlib.sha256(explanation.encode("utf-8")).hexdigest(), fps)
+        final_path = str(_VIDEOS_DIR_PATH / f"{video_id}.mp4")
+        
+        cached_path = self._text_video_cache.get(key)
+        if cached_path and Path(cached_path).exists():
+            if cached_path != final_path:
+                link_or_copy(cached_path, final_path)
+            logger.debug("[VIDEO PIPELINE] Reused text video %s", cached_path)
+            return final_path
+        
+        video_path = self.text_gen.generate_video(topic, explanation, video_id=video_id, fps=fps)
+        if video_path:
+            if len(self._text_video_cache) >= 256:
+                self._text_video_cache.clear()
+            self._text_video_cache[key] = str(video_path)
+        return video_path
+
+    def create_ai_image_video(self, answer_text: str, video_id: str, num_scenes: int = 3) -> str:
+        """
+        Create a Ken Burns story from AI-generated scene images.
+        Scenes are encoded as soon as they (and all earlier scenes) finish
+        downloading, so encoding overlaps the remaining image generation.
+        """
+        output_path = str(_VIDEOS_DIR_PATH / f"{video_id}.mp4")
+        
+        logger.debug("[VIDEO PIPELINE] Streaming %d AI scenes into the encoder for %s...", num_scenes, video_id)
+        scene_stream = self.image_gen.iter_scene_images(answer_text, video_id, num_scenes=num_scenes)
+        return self.animator.create_video_from_image_stream(
+            scene_stream, output_path, duration_per_image=3, transition_duration=0.5
+        )
+
+
+_GENERATOR = None
+_GENERATOR_LOCK = threading.Lock()
+
+# Renders awaited through generate_video_async run here, off the event loop
+VIDEO_WORKERS = 4
+_VIDEO_EXECUTOR = ThreadPoolExecutor(max_workers=VIDEO_WORKERS, thread_name_prefix="video-render")
+
+
+def _get_generator() -> HybridVideoGenerator:
+    """Shared generator, so Manim and the text renderer are set up once per process"""
+    global _GENERATOR
+    if _GENERATOR is None:
+        # Concurrent first requests must not both build the generator
+        with _GENERATOR_LOCK:
+            if _GENERATOR is None:
+                _GENERATOR = HybridVideoGenerator()
+    return _GENERATOR
+
+
+def _warmup():
+    """Build the shared generator and run the one-time probes before the first request"""
+    try:
+        generator = _get_generator()
+        generator.manim_gen  # Gemini model + Manim render workers
+        
+        # Encoder probes are cached per process
+        if select_ffmpeg_encoder() is None:
+            best_fourcc()
+        
+        # Load (or compile) the Numba cross-fade kernel with the real argument types
+        from ._blend_numba import crossfade_inplace
+        if crossfade_inplace is not None:
+            frame = np.zeros((2, 2, 3), dtype=np.uint8)
+            crossfade_inplace(frame, frame.copy(), frame.copy(), np.float32(0.5))
+        logger.debug("[VIDEO PIPELINE] Warm-up finished")
+    except Exception as e:
+        logger.warning("[VIDEO PIPELINE] Warm-up failed: %s", e)
+
+
+_warmup_thread = None
+
+
+def start_warmup():
+    """
+    Warm up the pipeline on a background thread so the first request does not
+    pay for it. Called by servers at startup (not at import, so scripts that
+    only import the package start nothing); VIDEO_PIPELINE_WARMUP=0 disables it.
+    """
+    global _warmup_thread
+    if os.environ.get("VIDEO_PIPELINE_WARMUP", "1") != "1":
+        return
+    with _GENERATOR_LOCK:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warmup, daemon=True, name="video-warmup")
+            _warmup_thread.start()
+
 
 # Main function to replace the current implementation
 def generate_video(script_scenes: List[str], video_id: str, videos_dir: str = "videos") -> str:
@@ -75,25 +264,34 @@ def generate_video(script_scenes: List[str], video_id: str, videos_dir: str = "v
         videos_dir: Directory to save videos
         
     Returns:
-        Path to the generated video file
+        Path to the generated video file (where the generator actually wrote it)
     """
-    print(f"\n[VIDEO PIPELINE] Starting hybrid AI video generation for task {video_id}")
+    logger.debug("[VIDEO PIPELINE] Starting hybrid AI video generation for task %s", video_id)
     
     # Get answer text from first scene
     answer_text = script_scenes[0] if script_scenes else "Educational content"
     
-    # Create generator and generate video
-    generator = HybridVideoGenerator()
+    # Reuse the shared generator and generate video
+    generator = _get_generator()
     video_path = generator.create_video_from_answer(answer_text, video_id, script_scenes=script_scenes)
     
     if video_path:
-        print(f"[VIDEO PIPELINE] Video generation completed successfully")
-    else:
-        print(f"[VIDEO PIPELINE] Video generation failed")
+        logger.debug("[VIDEO PIPELINE] Video generation completed successfully")
+        return str(video_path)
     
+    logger.warning("[VIDEO PIPELINE] Video generation failed for %s", video_id)
     return f"{videos_dir}/{video_id}.mp4"
 
 
+async def generate_video_async(script_scenes: List[str], video_id: str, videos_dir: str = "videos") -> str:
+    """
+    Async variant of generate_video: the render runs on a worker thread, so
+    the event loop keeps serving other requests meanwhile
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_VIDEO_EXECUTOR, generate_video, script_scenes, video_id, videos_dir)
+
+
 def generate_video_with_progress(
     script_scenes: List[str],
     video_id: str,